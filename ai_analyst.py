@@ -22,6 +22,7 @@ def get_ai_narrative(data, forecast_data):
     3. **Shift Comparison:** {json.dumps(data['Shifts'])}
     4. **Problematic Hours:** {json.dumps(data['Heatmap'])}
     5. **Asset Performance:** {json.dumps(data['Assets'])}
+    6. **Speed Percentiles (AutomationTimeSeconds P50/P95/P99):** {json.dumps(data.get('Latency_Percentiles', {}))}
     
     ### PREDICTIVE INTELLIGENCE (FUTURE OUTLOOK):
     The following data comes from our Machine Learning models (Regression + Holt-Winters):
@@ -35,18 +36,21 @@ def get_ai_narrative(data, forecast_data):
     **1. Executive Summary & Trends:**
     - Provide a "Stability Score" out of 10.
     - Summarise Week-on-Week (WoW) performance.
+    - Judge speed on the P50/P95 percentiles, not just the average; call out any tail (P99) deterioration.
     
     **2. Operational Bottlenecks:**
     - Compare Day vs Night shift efficiency.
     - Identify the specific problematic hour.
 
     **3. Statistical Asset Benchmarking:**
-    - Highlight the worst performing asset vs its history.
+    - Highlight the worst performing asset vs its history (use P95 vs Hist_P95 for speed).
     
     **4. Future Outlook & Projections:**
     - Explicitly mention the **Projected Volume** for the next 7 days.
     - Discuss the **Trend Direction** (Increasing/Decreasing) for Speed and Errors over the next month.
+    - If 'Next_7_Days_Hourly' is present, name the forecast peak hours and compare projected Day vs Night shift load and error rate.
     - Provide a tactical recommendation based on these forecasts (e.g., "Prepare for rising volume next week").
+    - Use 'Model_Backtest_Accuracy' (historic MAPE at day 7 / day 28) to state how much confidence each projection deserves.
     """
 
     response = client.chat.completions.create(
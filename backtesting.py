@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import warnings
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sklearn.linear_model import LinearRegression
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+import config
+
+# Rolling-origin backtest for the daily forecast models used in predictive_analytics.
+# Every origin refits each candidate on history up to that day and scores the next
+# HORIZON days, so each metric has a MAPE/MASE curve for every horizon from 1 to 28 days.
+
+CANDIDATES = ['linear', 'hw_add', 'hw_mul']
+METRICS = ['Vol', 'Errors', 'Speed', 'ErrorRate']
+HORIZON = 28
+SEASON = 7
+MIN_TRAIN_DAYS = 84
+ORIGIN_STEP_DAYS = 7
+
+def daily_series(history_df, column):
+    """Daily series exactly as the charts see it: tz-naive, cut at the report week, gaps interpolated."""
+    dates = pd.to_datetime(history_df['Submitted']).dt.tz_localize(None)
+    series = pd.Series(history_df[column].values, index=dates).astype(float)
+    series = series[series.index <= pd.to_datetime(config.CURRENT_WEEK_END)].sort_index()
+    return series.asfreq('D').interpolate()
+
+def default_model(series):
+    """The original heuristic: multiplicative seasonality unless zeros/negatives exist."""
+    return 'hw_mul' if (series > 0).all() else 'hw_add'
+
+def usable_model(series, model):
+    """The selected model, unless it can't fit this series (hw_mul with values <= 0) - then the heuristic."""
+    if model == 'hw_mul' and (series <= 0).any():
+        fallback = default_model(series)
+        print(f"   -> Selected hw_mul can't fit current data (values <= 0), using {fallback}")
+        return fallback
+    return model
+
+def forecast(series, model, horizon):
+    """Point forecast of `horizon` days from a daily series using one of CANDIDATES."""
+    future_index = pd.date_range(series.index[-1] + pd.Timedelta(days=1), periods=horizon, freq='D')
+
+    if model == 'linear':
+        X = np.array([d.toordinal() for d in series.index]).reshape(-1, 1)
+        X_future = np.array([d.toordinal() for d in future_index]).reshape(-1, 1)
+        regression = LinearRegression().fit(X, series.values)
+        return pd.Series(regression.predict(X_future), index=future_index)
+
+    if model not in ('hw_add', 'hw_mul'):
+        raise ValueError(f"Unknown model '{model}'")
+    if model == 'hw_mul' and (series <= 0).any():
+        raise ValueError("Multiplicative seasonality needs a strictly positive series")
+
+    fitted = ExponentialSmoothing(
+        series,
+        trend='add',
+        seasonal='mul' if model == 'hw_mul' else 'add',
+        seasonal_periods=SEASON,
+        damped_trend=False
+    ).fit()
+    return pd.Series(fitted.forecast(horizon).values, index=future_index)
+
+def _backtest_origin(task):
+    """Fits every candidate at one origin. Runs in a worker process."""
+    metric, series, origin = task
+    train = series.iloc[:origin]
+    actual = series.iloc[origin:origin + HORIZON].values
+
+    # MASE scale: in-sample MAE of the seasonal naive (same weekday last week)
+    scale = np.mean(np.abs(train.values[SEASON:] - train.values[:-SEASON]))
+
+    results = []
+    for model in CANDIDATES:
+        try:
+            predicted = forecast(train, model, HORIZON).values
+        except Exception:
+            results.append({"Metric": metric, "Model": model, "Failed": True})
+            continue
+
+        abs_err = np.abs(actual - predicted)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ape = np.where(actual != 0, abs_err / np.abs(actual), np.nan)
+            scaled = abs_err / scale if scale > 0 else np.full(HORIZON, np.nan)
+        results.append({"Metric": metric, "Model": model, "Failed": False, "APE": ape, "Scaled": scaled})
+    return results
+
+def _run_tasks(tasks):
+    workers = max(1, min(config.BACKTEST_WORKERS, os.cpu_count() or 1))
+    if workers > 1:
+        try:
+            # Spawn, not fork: forking the multithreaded Functions worker can deadlock
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                return list(pool.map(_backtest_origin, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        except (OSError, BrokenProcessPool) as e:
+            print(f"   -> Backtest pool unavailable ({e}), running serially")
+    return [_backtest_origin(task) for task in tasks]
+
+def _nan_to_none(values):
+    return [None if np.isnan(v) else round(float(v), 4) for v in values]
+
+def run_backtest(history_df):
+    """Replays the history with rolling origins and scores every candidate per metric and horizon."""
+    started = time.monotonic()
+    series_by_metric = {m: daily_series(history_df, m) for m in METRICS if m in history_df}
+
+    tasks = []
+    for metric, series in series_by_metric.items():
+        for origin in range(MIN_TRAIN_DAYS, len(series) - HORIZON + 1, ORIGIN_STEP_DAYS):
+            tasks.append((metric, series, origin))
+    print(f"   -> Backtesting {len(CANDIDATES)} models over {len(tasks)} metric/origin pairs...")
+
+    collected = {}
+    for origin_results in _run_tasks(tasks):
+        for r in origin_results:
+            collected.setdefault((r['Metric'], r['Model']), []).append(r)
+
+    metrics = {}
+    for metric in series_by_metric:
+        models = {}
+        for model in CANDIDATES:
+            runs = collected.get((metric, model), [])
+            ok = [r for r in runs if not r['Failed']]
+            if ok:
+                # All-NaN horizons (e.g. an all-zero metric) are expected - keep them as None quietly
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', category=RuntimeWarning)
+                    mape = np.nanmean(np.vstack([r['APE'] for r in ok]), axis=0) * 100
+                    mase = np.nanmean(np.vstack([r['Scaled'] for r in ok]), axis=0)
+            else:
+                mape = mase = np.full(HORIZON, np.nan)
+            models[model] = {
+                "Origins": len(ok),
+                "Failures": len(runs) - len(ok),
+                "MAPE": _nan_to_none(mape),
+                "MASE": _nan_to_none(mase)
+            }
+        metrics[metric] = {"Selected": _select(models), "Models": models}
+
+    print(f"      ...Backtest completed in {time.monotonic() - started:.1f}s")
+    return {
+        "Generated": pd.Timestamp.now(tz='UTC').isoformat(),
+        **_fingerprint(),
+        "Origins": len(tasks),
+        "Duration_Seconds": round(time.monotonic() - started, 1),
+        "Metrics": metrics
+    }
+
+def _fingerprint():
+    """What the results were computed from - stored results are only reused if all of it matches."""
+    return {
+        "Source": f"{config.ADX_CLUSTER}/{config.ADX_DB}",
+        "Country": config.FILTER_COUNTRY,
+        "Data_End": config.CURRENT_WEEK_END,
+        "Candidates": list(CANDIDATES),
+        "Horizon_Days": HORIZON
+    }
+
+def _select(models):
+    """Lowest mean MASE across all horizons, among models that never failed."""
+    scores = {}
+    for model, result in models.items():
+        mase = [v for v in result['MASE'] if v is not None]
+        if result['Origins'] and not result['Failures'] and mase:
+            scores[model] = float(np.mean(mase))
+    return min(scores, key=scores.get) if scores else None
+
+def save_results(results):
+    try:
+        directory = os.path.dirname(config.BACKTEST_RESULTS_PATH)
+        if directory: os.makedirs(directory, exist_ok=True)
+        with open(config.BACKTEST_RESULTS_PATH, "w") as f:
+            json.dump(results, f, indent=2)
+    except Exception as e:
+        print(f"   -> Failed to save backtest results: {e}")
+
+def load_results():
+    """
+    Returns stored results only if they were computed from the same source, country, candidate
+    set and horizon, and both their run date and data window are within BACKTEST_MAX_AGE_DAYS
+    (the data window must not end after the current one). Otherwise None.
+    """
+    try:
+        with open(config.BACKTEST_RESULTS_PATH, "r") as f:
+            results = json.load(f)
+
+        expected = _fingerprint()
+        for key in ('Source', 'Country', 'Candidates', 'Horizon_Days'):
+            if results.get(key) != expected[key]:
+                print(f"   -> Stored backtest ignored: {key} changed")
+                return None
+
+        max_age = pd.Timedelta(days=config.BACKTEST_MAX_AGE_DAYS)
+        window_shift = pd.to_datetime(expected['Data_End']) - pd.to_datetime(results['Data_End'])
+        if window_shift < pd.Timedelta(0) or window_shift > max_age:
+            print("   -> Stored backtest ignored: computed on a different data window")
+            return None
+        if pd.Timestamp.now(tz='UTC') - pd.Timestamp(results['Generated']) > max_age:
+            return None
+        return results
+    except Exception:
+        return None
+
+def _estimated_cost():
+    """Duration of the last stored backtest (even a stale one), else BACKTEST_COST_PRIOR_SECONDS."""
+    try:
+        with open(config.BACKTEST_RESULTS_PATH, "r") as f:
+            return float(json.load(f)['Duration_Seconds'])
+    except Exception:
+        return config.BACKTEST_COST_PRIOR_SECONDS
+
+def ensure_model_selection(history_df, deadline=None):
+    """
+    Weekly entry point: reuses stored backtest results, re-running the backtest only when stale.
+    `deadline` (time.monotonic()) is the end of the Function budget; a re-run that is not
+    expected to finish before it is skipped and the heuristic models are used this run.
+    """
+    results = load_results()
+    if results is not None:
+        print(f"   -> Using stored backtest from {results['Generated'][:10]}")
+        return results
+    if history_df.empty:
+        return {}
+    if deadline is not None:
+        est_cost = _estimated_cost()
+        if time.monotonic() + est_cost > deadline:
+            print(f"   -> Skipping backtest: ~{est_cost:.0f}s needed, not enough Function budget left")
+            return {}
+
+    results = run_backtest(history_df)
+    # Too little history for any origin (or nothing selectable) - use it this run, but don't pin it
+    if results['Origins'] and selected_models(results):
+        save_results(results)
+    else:
+        print("   -> Backtest produced no model selection - not storing results")
+    return results
+
+def selected_models(results):
+    """Maps metric -> selected model name, skipping metrics with no valid candidate."""
+    return {metric: r['Selected'] for metric, r in (results or {}).get('Metrics', {}).items() if r.get('Selected')}
+
+def summarise(results, used=None):
+    """
+    Compact accuracy summary for the AI: the model that actually ran for each metric (`used`,
+    defaulting to the selection) and its day-7 and day-28 backtest error.
+    """
+    summary = {}
+    for metric, r in (results or {}).get('Metrics', {}).items():
+        selected = r.get('Selected')
+        model = (used or {}).get(metric, selected)
+        if not model or model not in r.get('Models', {}): continue
+        scores = r['Models'][model]
+        summary[metric] = {
+            "Model": model,
+            **({"Overridden_Selection": selected} if model != selected else {}),
+            "MAPE_Day7": scores['MAPE'][6],
+            "MAPE_Day28": scores['MAPE'][HORIZON - 1],
+            "MASE_Day7": scores['MASE'][6],
+            "MASE_Day28": scores['MASE'][HORIZON - 1]
+        }
+    return summary
@@ -1,5 +1,6 @@
 import os
 import json
+import tempfile
 
 if os.path.exists("local.settings.json"):
     with open("local.settings.json", "r") as f:
@@ -29,4 +30,63 @@ FILTER_COUNTRY        = os.getenv("FILTER_COUNTRY", "UK")
 # Reporting Period
 
 CURRENT_WEEK_START    = "2025-11-24" 
-CURRENT_WEEK_END      = "2025-11-30"
\ No newline at end of file
+CURRENT_WEEK_END      = "2025-11-30"
+
+# Persistent Storage
+# Root for everything that must survive between weekly runs (KQL cache, stored backtest,
+# latency sketches). Defaults to $HOME, which on an Azure Functions host is the shared
+# persistent file share - instance temp storage is usually gone by the next timer run.
+# Point this at a mounted share when running anywhere without a persistent $HOME.
+
+PERSISTENT_DATA_DIR   = os.getenv("PERSISTENT_DATA_DIR", os.path.join(os.path.expanduser("~"), "data", "executive_benchmark"))
+
+# KQL Result Cache
+# Results are pickled to disk keyed by cluster + database + normalised query text.
+# Short TTL for anything that can still change (current week, ago()-relative windows),
+# long TTL for closed historical windows - but only for entries written after the window
+# closed plus the ingestion grace period, so a mid-week run never gets served for a week.
+
+KQL_CACHE_ENABLED     = os.getenv("KQL_CACHE_ENABLED", "true").lower() == "true"
+KQL_CACHE_DIR         = os.getenv("KQL_CACHE_DIR", os.path.join(PERSISTENT_DATA_DIR, "kql_cache"))
+KQL_CACHE_TTL_SHORT   = int(os.getenv("KQL_CACHE_TTL_SHORT", 15 * 60))        # 15 minutes
+KQL_CACHE_TTL_LONG    = int(os.getenv("KQL_CACHE_TTL_LONG", 7 * 24 * 60 * 60)) # 7 days
+INGESTION_GRACE_HOURS = int(os.getenv("INGESTION_GRACE_HOURS", 6))            # Late-arriving PrinterLogs
+
+# Latency Sketch Store
+# One file per closed day; only days missing from the store are queried from ADX.
+
+SKETCH_STORE_DIR      = os.getenv("SKETCH_STORE_DIR", os.path.join(PERSISTENT_DATA_DIR, "latency_sketches"))
+
+
+# Function Time Budget
+# Wall-clock seconds for the WHOLE run_orchestrator: every KQL fetch, the backtest (when
+# stale), all chart fits, the hourly fetch + fit, the AI call, PDF build and email.
+# Defaults to the Consumption plan's 5 minute functionTimeout. The reserve is held back
+# after the hourly fit for the AI narrative, PDF and email.
+
+FUNCTION_TIME_BUDGET_SECONDS  = int(os.getenv("FUNCTION_TIME_BUDGET_SECONDS", 300))
+POST_FORECAST_RESERVE_SECONDS = int(os.getenv("POST_FORECAST_RESERVE_SECONDS", 60))
+
+# Hourly Forecast Mode
+# 1h bins over 180 days with 24h + 168h seasonality. HOURLY_FIT_BUDGET_SECONDS caps the
+# hourly fits on top of whatever is left of the Function budget. An MSTL fit only starts
+# if the remaining time covers its estimated cost (a prior for the first series, then the
+# measured cost of the previous fit); otherwise that series uses seasonal naive.
+
+HOURLY_FORECAST_ENABLED   = os.getenv("HOURLY_FORECAST_ENABLED", "true").lower() == "true"
+HOURLY_FIT_BUDGET_SECONDS = int(os.getenv("HOURLY_FIT_BUDGET_SECONDS", 90))
+HOURLY_FIT_COST_PRIOR_SECONDS = int(os.getenv("HOURLY_FIT_COST_PRIOR_SECONDS", 15))
+
+
+# Forecast Backtesting
+# Rolling-origin backtest results are stored as JSON under PERSISTENT_DATA_DIR and reused
+# until they are older than BACKTEST_MAX_AGE_DAYS, so the weekly run only reads the stored
+# model selection. A stale backtest only re-runs if its estimated cost (the last run's
+# duration, or the prior below) fits in what is left of FUNCTION_TIME_BUDGET_SECONDS;
+# otherwise that run falls back to the add/mul heuristic. Workers are spawned processes
+# and capped at the CPU count - a single-CPU host runs the origins serially.
+
+BACKTEST_RESULTS_PATH = os.getenv("BACKTEST_RESULTS_PATH", os.path.join(PERSISTENT_DATA_DIR, "backtest_results.json"))
+BACKTEST_MAX_AGE_DAYS = int(os.getenv("BACKTEST_MAX_AGE_DAYS", 28))
+BACKTEST_WORKERS      = int(os.getenv("BACKTEST_WORKERS", os.cpu_count() or 1))
+BACKTEST_COST_PRIOR_SECONDS = int(os.getenv("BACKTEST_COST_PRIOR_SECONDS", 60))
@@ -2,14 +2,95 @@ import pandas as pd
 from azure.kusto.data import KustoClient, KustoConnectionStringBuilder
 from azure.kusto.data.helpers import dataframe_from_result_table
 import config
+import kql_cache
+import latency_sketch
+import sketch_store
+
+# One client per process - avoids a fresh az-cli token fetch for every fetch_* call
+_client = None
 
 def get_client():
-    kcsb = KustoConnectionStringBuilder.with_az_cli_authentication(config.ADX_CLUSTER)
-    return KustoClient(kcsb)
+    global _client
+    if _client is None:
+        kcsb = KustoConnectionStringBuilder.with_az_cli_authentication(config.ADX_CLUSTER)
+        _client = KustoClient(kcsb)
+    return _client
+
+def window_cache():
+    """
+    (ttl, written_after) for queries pinned to the reporting week. The long TTL only applies
+    once the week has closed plus the ingestion grace, and only to entries written after that.
+    """
+    closed_at = (pd.Timestamp(config.CURRENT_WEEK_END, tz='UTC') + pd.Timedelta(days=1)
+                 + pd.Timedelta(hours=config.INGESTION_GRACE_HOURS))
+    if pd.Timestamp.now(tz='UTC') >= closed_at:
+        return config.KQL_CACHE_TTL_LONG, closed_at.timestamp()
+    return config.KQL_CACHE_TTL_SHORT, None
+
+def run_query(query, ttl, written_after=None):
+    """Executes a KQL query via the disk cache and returns the primary result as a DataFrame."""
+    df = kql_cache.get(config.ADX_CLUSTER, config.ADX_DB, query, ttl, written_after)
+    if df is not None:
+        return df
+
+    response = get_client().execute(config.ADX_DB, query)
+    df = dataframe_from_result_table(response.primary_results[0])
+    kql_cache.put(config.ADX_CLUSTER, config.ADX_DB, query, df)
+    return df
+
+def fetch_latency_sketches():
+    """
+    Returns 180 days of AutomationTimeSeconds as mergeable sketches (day x country x printer).
+    Closed days come from the sketch store; ADX is only scanned from the first missing day on.
+    """
+    print("   -> Fetching 180-Day Latency Sketches...")
+
+    end_day = pd.to_datetime(config.CURRENT_WEEK_END)
+    days = list(pd.date_range(end_day - pd.Timedelta(days=180), end_day, freq='D'))
+    try:
+        stored_df, missing = sketch_store.load(days)
+    except Exception as e:
+        print(f"   -> Sketch store unavailable ({e}), querying all days")
+        stored_df, missing = pd.DataFrame(), days
+    if not missing:
+        print(f"      ...All {len(days)} days served from the sketch store.")
+        return stored_df
 
-def fetch_deep_dive_data():
+    first_missing = min(missing)
+    query_sketches = f"""
+    let End = endofday(datetime({config.CURRENT_WEEK_END}));
+    let Start = startofday(datetime({first_missing:%Y-%m-%d}));
+    PrinterLogs
+    | where Submitted between (Start .. End) and Country == "{config.FILTER_COUNTRY}"
+    | extend T = todouble(AutomationTimeSeconds)
+    | where isnotnull(T)
+    | extend Bucket = {latency_sketch.bucket_expr('T')}
+    | summarize Count = count() by Day = bin(Submitted, 1d), Country, EnginePrinter, Bucket
+    | summarize Sketch = make_bag(bag_pack(tostring(Bucket), Count)) by Day, Country, EnginePrinter
+    """
+
+    try:
+        packed_df = run_query(query_sketches, *window_cache())
+        fetched = latency_sketch.unpack(packed_df)
+        fetched['Day'] = pd.to_datetime(fetched['Day'], utc=True).dt.tz_localize(None)
+        saved = sketch_store.save(fetched, missing)
+        print(f"      ...{len(days) - len(missing)} days from store, queried {len(missing)} "
+              f"({len(packed_df)} sketches), stored {saved} newly closed days.")
+
+        # The query re-covers every day from first_missing, so drop stored copies of those
+        if not stored_df.empty:
+            stored_df = stored_df[stored_df['Day'] < first_missing]
+        df = pd.concat([stored_df, fetched], ignore_index=True) if not stored_df.empty else fetched
+        if df.empty:
+            print("   !! WARNING: No latency sketches returned - P50/P95/P99 will be missing from charts, table and narrative.")
+        return df
+    except Exception as e:
+        print(f"   !! WARNING: Failed to fetch latency sketches ({e}) - P50/P95/P99 will be missing from charts, table and narrative.")
+        return pd.DataFrame()
+
+def fetch_deep_dive_data(sketch_df=None):
     """Fetches the current week's detailed tactical data for the AI Narrative."""
-    client = get_client()
+    if sketch_df is None: sketch_df = fetch_latency_sketches()
     print(f"   -> Fetching Tactical Data ({config.CURRENT_WEEK_START})...")
 
     # 1. BASELINE (Current Week Context)
@@ -107,13 +188,16 @@ def fetch_deep_dive_data():
     # Execution
     print("      ...Executing KQL batch")
     # Note: KustoClient execution order must match the query definition order above
-    base_df = dataframe_from_result_table(client.execute(config.ADX_DB, query_baseline).primary_results[0])
-    comp_df = dataframe_from_result_table(client.execute(config.ADX_DB, query_comparatives).primary_results[0])
-    shifts_df = dataframe_from_result_table(client.execute(config.ADX_DB, query_shifts).primary_results[0])
-    heatmap_df = dataframe_from_result_table(client.execute(config.ADX_DB, query_heatmap).primary_results[0])
-    hourly_trend_df = dataframe_from_result_table(client.execute(config.ADX_DB, query_hourly_trend).primary_results[0])
-    assets_df = dataframe_from_result_table(client.execute(config.ADX_DB, query_assets).primary_results[0])
-    bench_df = dataframe_from_result_table(client.execute(config.ADX_DB, query_asset_benchmarks).primary_results[0])
+    # Queries pinned to the reporting week can be cached for long once it closes;
+    # ago()-relative queries move every day so only get the short TTL.
+    week_cache = window_cache()
+    base_df = run_query(query_baseline, *week_cache)
+    comp_df = run_query(query_comparatives, *week_cache)
+    shifts_df = run_query(query_shifts, *week_cache)
+    heatmap_df = run_query(query_heatmap, *week_cache)
+    hourly_trend_df = run_query(query_hourly_trend, config.KQL_CACHE_TTL_SHORT)
+    assets_df = run_query(query_assets, *week_cache)
+    bench_df = run_query(query_asset_benchmarks, config.KQL_CACHE_TTL_SHORT)
 
     # Formatting
     if not heatmap_df.empty:
@@ -152,12 +236,34 @@ def fetch_deep_dive_data():
     def safe_json(df):
         return df.head(10).astype(str).to_dict(orient='records')
 
+    # Latency percentiles - merged from the daily sketches rather than rescanning raw rows
+    curr_start = pd.to_datetime(config.CURRENT_WEEK_START)
+    curr_end = pd.to_datetime(config.CURRENT_WEEK_END)
+    curr_sketch = latency_sketch.window(sketch_df, curr_start, curr_end)
+
+    if sketch_df.empty:
+        latency = {"Status": "Unavailable - latency sketches could not be fetched this run"}
+    else:
+        latency = {
+            "Current": latency_sketch.quantiles(curr_sketch),
+            "LastWeek": latency_sketch.quantiles(
+                latency_sketch.window(sketch_df, curr_start - pd.Timedelta(days=7), curr_end - pd.Timedelta(days=7))),
+            "Historic_180d": latency_sketch.quantiles(sketch_df)
+        }
+
+    asset_pcts = latency_sketch.quantiles(curr_sketch, by=['EnginePrinter'])
+    hist_pcts = latency_sketch.quantiles(sketch_df, by=['EnginePrinter'])[['EnginePrinter', 'P95']]
+    hist_pcts = hist_pcts.rename(columns={'P95': 'Hist_P95'})
+
     merged_assets = pd.merge(assets_df, bench_df, on='EnginePrinter', how='left')
+    merged_assets = pd.merge(merged_assets, asset_pcts, on='EnginePrinter', how='left')
+    merged_assets = pd.merge(merged_assets, hist_pcts, on='EnginePrinter', how='left')
 
     return {
         "Period": f"{config.CURRENT_WEEK_START} to {config.CURRENT_WEEK_END}",
         "Baseline": baseline,
         "Comparatives": comparatives, # <--- This key is what was missing!
+        "Latency_Percentiles": latency,
         "Shifts": safe_json(shifts_df),
         "Heatmap": safe_json(heatmap_df),
         "Historic_Hourly_Trend": safe_json(hourly_trend_df),
@@ -165,9 +271,9 @@ def fetch_deep_dive_data():
         "Assets_DF": assets_df
     }
 
-def fetch_long_term_data():
+def fetch_long_term_data(sketch_df=None):
     """Fetches 180 days of granular data to build the Executive Predictive Models."""
-    client = get_client()
+    if sketch_df is None: sketch_df = fetch_latency_sketches()
     print("   -> Fetching 180-Day Historic Data for Predictive Modeling...")
 
     query_history = f"""
@@ -184,8 +290,7 @@ def fetch_long_term_data():
     """
     
     try:
-        response = client.execute(config.ADX_DB, query_history)
-        df = dataframe_from_result_table(response.primary_results[0])
+        df = run_query(query_history, *window_cache())
         
         df['Submitted'] = pd.to_datetime(df['Submitted'])
         df['Vol'] = pd.to_numeric(df['Vol'])
@@ -193,9 +298,57 @@ def fetch_long_term_data():
         df['Errors'] = pd.to_numeric(df['Errors'])
         df['ErrorRate'] = (df['Errors'] / df['Vol']) * 100
         df['ErrorRate'] = df['ErrorRate'].fillna(0)
+
+        # Daily Speed percentiles from the sketches (Speed itself stays the mean)
+        daily_pcts = latency_sketch.quantiles(sketch_df, by=['Day'])
+        if not daily_pcts.empty:
+            daily_pcts = daily_pcts.rename(columns={q: f"Speed_{q}" for q in latency_sketch.QUANTILES})
+            df['Day'] = pd.to_datetime(df['Submitted'], utc=True).dt.tz_localize(None)
+            df = pd.merge(df, daily_pcts, on='Day', how='left').drop(columns=['Day'])
         
         print(f"      ...Retrieved {len(df)} days of historic context.")
         return df
     except Exception as e:
         print(f"Failed to fetch history: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+def fetch_hourly_history():
+    """Fetches 180 days at 1h resolution plus the hour-of-day -> Shift mapping for the hourly forecast."""
+    print("   -> Fetching 180-Day Hourly History for Shift Forecasting...")
+
+    query_hourly = f"""
+    let End = endofday(datetime({config.CURRENT_WEEK_END}));
+    let Start = startofday(datetime({config.CURRENT_WEEK_END}) - 180d);
+    PrinterLogs
+    | where Submitted between (Start .. End) and Country == "{config.FILTER_COUNTRY}"
+    | summarize 
+        Vol = count(), 
+        Errors = countif(JobStatus=='Error')
+        by bin(Submitted, 1h)
+    | order by Submitted asc
+    """
+
+    # Each hour of day is assigned to whichever Shift logs the most jobs in it
+    query_shift_hours = f"""
+    let End = endofday(datetime({config.CURRENT_WEEK_END}));
+    let Start = startofday(datetime({config.CURRENT_WEEK_END}) - 180d);
+    PrinterLogs
+    | where Submitted between (Start .. End) and Country == "{config.FILTER_COUNTRY}"
+    | summarize Jobs = count() by Hour = hourofday(Submitted), Shift
+    """
+
+    try:
+        df = run_query(query_hourly, *window_cache())
+        df['Submitted'] = pd.to_datetime(df['Submitted'])
+        df['Vol'] = pd.to_numeric(df['Vol'])
+        df['Errors'] = pd.to_numeric(df['Errors'])
+
+        shifts_df = run_query(query_shift_hours, *window_cache())
+        shifts_df = shifts_df.sort_values('Jobs').drop_duplicates('Hour', keep='last')
+        shift_map = {int(h): str(s) for h, s in zip(shifts_df['Hour'], shifts_df['Shift'])}
+
+        print(f"      ...Retrieved {len(df)} hours of historic context.")
+        return df, shift_map
+    except Exception as e:
+        print(f"Failed to fetch hourly history: {e}")
+        return pd.DataFrame(), {}
@@ -0,0 +1,111 @@
+import os
+import re
+import time
+import stat
+import hashlib
+import pandas as pd
+import config
+
+# Per-process counters, reported at the end of a run
+_stats = {"Hits": 0, "Misses": 0, "Bytes_Saved": 0}
+_dir_checked = None
+
+def _cache_dir_ready():
+    """
+    Creates the cache directory owner-only (0o700) and refuses to use one anyone else can write.
+    Entries are pickles, so a foreign-writable directory would mean arbitrary code on read.
+    """
+    global _dir_checked
+    if _dir_checked is not None:
+        return _dir_checked
+
+    directory = config.KQL_CACHE_DIR
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.lstat(directory)
+        owned = not hasattr(os, "getuid") or st.st_uid == os.getuid()
+        if stat.S_ISLNK(st.st_mode) or not stat.S_ISDIR(st.st_mode) or not owned:
+            raise PermissionError(f"{directory} is not a directory owned by this user")
+        if st.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+        _dir_checked = True
+    except Exception as e:
+        print(f"   -> KQL cache disabled: {e}")
+        _dir_checked = False
+    return _dir_checked
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _prune():
+    """Deletes entries older than the longest TTL - nothing can still be valid past that."""
+    cutoff = time.time() - max(config.KQL_CACHE_TTL_LONG, config.KQL_CACHE_TTL_SHORT)
+    try:
+        with os.scandir(config.KQL_CACHE_DIR) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                    _remove(entry.path)
+    except OSError:
+        pass
+
+def normalise_query(query):
+    """Collapses whitespace so re-indented but identical KQL shares a cache entry."""
+    return re.sub(r"\s+", " ", query).strip()
+
+def _cache_path(cluster, database, query):
+    key = "|".join([str(cluster), str(database), normalise_query(query)])
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(config.KQL_CACHE_DIR, f"{digest}.pkl")
+
+def get(cluster, database, query, ttl, written_after=None):
+    """
+    Returns the cached DataFrame for this query, or None if missing/expired.
+    `written_after` (epoch seconds) rejects entries written before that moment, e.g. a
+    result cached while the reporting week was still open.
+    """
+    if not config.KQL_CACHE_ENABLED or ttl <= 0 or not _cache_dir_ready():
+        return None
+
+    path = _cache_path(cluster, database, query)
+    try:
+        written_at = os.path.getmtime(path)
+        if time.time() - written_at > ttl or (written_after is not None and written_at < written_after):
+            _stats["Misses"] += 1
+            _remove(path)
+            return None
+        df = pd.read_pickle(path)
+    except Exception:
+        # Missing or unreadable entry - treat as a miss and let the caller re-query
+        _stats["Misses"] += 1
+        return None
+
+    _stats["Hits"] += 1
+    _stats["Bytes_Saved"] += os.path.getsize(path)
+    return df
+
+def put(cluster, database, query, df):
+    """Writes a result to disk. Failures are logged, never raised."""
+    if not config.KQL_CACHE_ENABLED or not _cache_dir_ready():
+        return
+
+    path = _cache_path(cluster, database, query)
+    try:
+        _prune()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path) # Atomic swap so concurrent runs never read half a file
+    except Exception as e:
+        print(f"   -> KQL cache write failed: {e}")
+
+def stats():
+    return dict(_stats)
+
+def report():
+    s = stats()
+    total = s["Hits"] + s["Misses"]
+    hit_rate = (s["Hits"] / total) * 100 if total else 0
+    print(f"   -> KQL cache: {s['Hits']} hits, {s['Misses']} misses ({hit_rate:.0f}% hit rate), "
+          f"{s['Bytes_Saved'] / 1024:.1f} KB served from disk")
@@ -0,0 +1,94 @@
+import json
+import numpy as np
+import pandas as pd
+
+# DDSketch-style latency sketches.
+# ADX assigns each AutomationTimeSeconds value to a log-spaced bucket and ships one
+# packed {bucket: count} bag per day x country x printer; unpack() expands that into
+# (Day, Country, EnginePrinter, Bucket, Count) rows. Merging sketches across any
+# window or grouping is just summing counts per bucket, and every quantile read back
+# is within RELATIVE_ACCURACY of the true value. 2% keeps 1s-600s to ~160 buckets
+# per bag, well inside ADX's result size limit for a 180-day fleet-wide query.
+
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+ZERO_BUCKET = -100000 # Holds values <= 0; sorts below every real bucket
+QUANTILES = {"P50": 0.50, "P95": 0.95, "P99": 0.99}
+
+def bucket_expr(column):
+    """KQL expression mapping a numeric column onto its sketch bucket index."""
+    return (f"iff({column} > 0, toint(ceiling(log({column}) / log({GAMMA!r}))), "
+            f"toint({ZERO_BUCKET}))")
+
+def bucket_value(buckets):
+    """Representative value for each bucket index (midpoint with bounded relative error)."""
+    buckets = np.asarray(buckets, dtype=float)
+    values = 2 * np.power(GAMMA, np.where(buckets == ZERO_BUCKET, 0, buckets)) / (GAMMA + 1)
+    return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+def unpack(packed_df, column='Sketch'):
+    """Expands one packed {bucket: count} bag per row into one row per (..., Bucket)."""
+    keys = [c for c in packed_df.columns if c != column]
+    data = {key: [] for key in keys + ['Bucket', 'Count']}
+    for record in packed_df.to_dict('records'):
+        bag = record[column]
+        if isinstance(bag, str): bag = json.loads(bag)
+        for bucket, count in (bag or {}).items():
+            for key in keys: data[key].append(record[key])
+            data['Bucket'].append(int(bucket))
+            data['Count'].append(int(count))
+    return pd.DataFrame(data, columns=keys + ['Bucket', 'Count'])
+
+def window(sketch_df, start, end):
+    """Restricts sketch rows to days between start and end (inclusive)."""
+    if sketch_df is None or sketch_df.empty: return pd.DataFrame()
+    days = sketch_df['Day']
+    return sketch_df[(days >= pd.to_datetime(start)) & (days <= pd.to_datetime(end))]
+
+def merge(sketch_df, by=None):
+    """Merges sketches down to one per group by summing bucket counts."""
+    keys = list(by or []) + ['Bucket']
+    return sketch_df.groupby(keys, as_index=False)['Count'].sum()
+
+def _sketch_quantiles(buckets, counts):
+    counts = np.asarray(counts, dtype=float)
+    total = counts.sum()
+    if total <= 0:
+        return {name: None for name in QUANTILES}
+
+    cumulative = np.cumsum(counts)
+    values = bucket_value(buckets)
+    result = {}
+    for name, q in QUANTILES.items():
+        rank = q * (total - 1)
+        idx = min(int(np.searchsorted(cumulative, rank, side='right')), len(values) - 1)
+        result[name] = round(float(values[idx]), 1)
+    return result
+
+def quantiles(sketch_df, by=None):
+    """
+    Derives P50/P95/P99 from sketch rows.
+
+    Args:
+        sketch_df (pd.DataFrame): Sketch rows with 'Bucket' and 'Count' plus any grouping columns.
+        by (list): Columns to group on. If omitted, all rows are merged into a single sketch.
+
+    Returns:
+        dict of quantiles when by is None, otherwise a DataFrame with one row per group.
+    """
+    by = list(by or [])
+    columns = by + list(QUANTILES)
+    if sketch_df is None or sketch_df.empty:
+        return pd.DataFrame(columns=columns) if by else _sketch_quantiles([], [])
+
+    merged = merge(sketch_df, by).sort_values(by + ['Bucket'])
+    if not by:
+        return _sketch_quantiles(merged['Bucket'], merged['Count'])
+
+    rows = []
+    for key, group in merged.groupby(by, sort=False):
+        key = key if isinstance(key, tuple) else (key,)
+        row = dict(zip(by, key))
+        row.update(_sketch_quantiles(group['Bucket'], group['Count']))
+        rows.append(row)
+    return pd.DataFrame(rows, columns=columns)
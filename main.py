@@ -1,35 +1,58 @@
 import base64
 import logging
+import time
 import azure.functions as func
 from azure.communication.email import EmailClient
 
 import config
-from data_engine import fetch_deep_dive_data, fetch_long_term_data
+import kql_cache
+from data_engine import fetch_deep_dive_data, fetch_long_term_data, fetch_latency_sketches, fetch_hourly_history
 from ai_analyst import get_ai_narrative
-from predictive_analytics import generate_executive_charts
+from predictive_analytics import generate_executive_charts, generate_hourly_forecast
+from backtesting import ensure_model_selection
 from report_generator import build_pdf
 
 app = func.FunctionApp()
 
 def run_orchestrator():
     print("--- STARTING EXECUTIVE BENCHMARK SEQUENCE ---")
+    # Everything from here to the email counts against FUNCTION_TIME_BUDGET_SECONDS
+    run_deadline = time.monotonic() + config.FUNCTION_TIME_BUDGET_SECONDS - config.POST_FORECAST_RESERVE_SECONDS
     
+    # 0. Fetch Latency Sketches once - shared by the weekly and long-term views
+    sketch_df = fetch_latency_sketches()
+
     # 1. Fetch Weekly Tactical Data (History)
-    weekly_data = fetch_deep_dive_data()
+    weekly_data = fetch_deep_dive_data(sketch_df)
     
     # 2. Fetch Long-Term Historic Data (History)
-    history_df = fetch_long_term_data()
+    history_df = fetch_long_term_data(sketch_df)
     
     # 3. GENERATE GRAPHS + PREDICTIVE DATA (The Swap!)
+    # Model choice per metric comes from the stored rolling-origin backtest (re-run only when stale)
+    backtest_results = ensure_model_selection(history_df, deadline=run_deadline)
     # 'forecast_stats' to pass to the AI
-    img_speed, img_vol, img_err, img_tactical, forecast_stats = generate_executive_charts(history_df)
+    img_speed, img_vol, img_err, img_tactical, forecast_stats = generate_executive_charts(history_df, backtest_results)
+
+    # 3b. HOURLY MODE - Hour x Shift forecast for next week
+    img_hourly = None
+    if config.HOURLY_FORECAST_ENABLED:
+        if time.monotonic() + config.HOURLY_FIT_COST_PRIOR_SECONDS > run_deadline:
+            print("   -> Skipping hourly forecast: not enough of the Function time budget left")
+        else:
+            hourly_df, shift_map = fetch_hourly_history()
+            img_hourly, hourly_stats = generate_hourly_forecast(hourly_df, shift_map, deadline=run_deadline)
+            forecast_stats['Next_7_Days_Hourly'] = hourly_stats
+
+    # All KQL fetches are done - report cache effectiveness across the whole run
+    kql_cache.report()
     
     # 4. Generate AI Commentary (Now with Forecast Intelligence)
     narrative = get_ai_narrative(weekly_data, forecast_stats)
     
     # 5. Build PDF
     print("   -> Compiling Executive PDF...")
-    pdf_bytes = build_pdf(narrative, weekly_data, img_speed, img_vol, img_err, img_tactical)
+    pdf_bytes = build_pdf(narrative, weekly_data, img_speed, img_vol, img_err, img_tactical, img_hourly)
     
     # 6. Save Locally
     with open("EXECUTIVE_BENCHMARK.pdf", "wb") as f:
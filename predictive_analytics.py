@@ -1,4 +1,5 @@
 import io
+import time
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -6,8 +7,10 @@ import matplotlib.dates as mdates
 import seaborn as sns
 from sklearn.linear_model import LinearRegression
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from statsmodels.tsa.seasonal import MSTL
 from datetime import timedelta
 import config
+import backtesting
 
 # --- VISUAL STYLE ---
 plt.style.use('seaborn-v0_8-whitegrid')
@@ -29,9 +32,9 @@ def get_trend_stats(dates, values):
     
     return trend, slope
 
-def add_extended_regression(ax, dates, values, future_days=28, color='green', label='Trend Line'):
-    """Draws regression line and returns the final projected value."""
-    if len(dates) < 2: return None
+def add_extended_regression(ax, dates, values, future_days=28, color='green', label='Trend Line', selected=False):
+    """Draws regression line and returns (final projected value, average projected value)."""
+    if len(dates) < 2: return None, None
 
     # 1. Fit Model
     X = np.array([d.toordinal() for d in dates]).reshape(-1, 1)
@@ -47,23 +50,26 @@ def add_extended_regression(ax, dates, values, future_days=28, color='green', la
     y_pred = model.predict(X_all)
 
     # 3. Plot
-    ax.plot(all_dates, y_pred, color=color, linestyle='--', linewidth=2.5, 
-            alpha=0.8, label=f'{label} (Projection)')
+    ax.plot(all_dates, y_pred, color=color, linestyle='--', linewidth=3 if selected else 2.5, 
+            alpha=0.8, label=f'{label} ({"Selected Projection" if selected else "Projection"})')
     
     # 4. Label
     final_val = y_pred[-1][0]
     ax.text(all_dates[-1], final_val, f"{final_val:.1f}", color=color, 
             fontweight='bold', ha='left', va='center', fontsize=10)
     
-    return final_val # Return for AI
+    return final_val, y_pred[-future_days:].mean() # Return for AI
 
-def add_holt_winters_forecast(ax, dates, values, future_days=28, color='red'):
+def add_holt_winters_forecast(ax, dates, values, future_days=28, color='red', selected_model=None):
     """Draws HW forecast and returns the average predicted value."""
     series = pd.Series(values.values, index=dates).astype(float).asfreq('D').interpolate()
     if len(series) < 14: return None
 
-    # Logic: Use 'add' if zeros exist, else 'mul'
-    if (series <= 0).any():
+    # Logic: Use the backtest-selected seasonality if given, else 'add' if zeros exist, else 'mul'
+    selected = selected_model in ('hw_add', 'hw_mul') and not (selected_model == 'hw_mul' and (series <= 0).any())
+    if selected:
+        season_mode, trend_mode = selected_model[3:], 'add'
+    elif (series <= 0).any():
         season_mode, trend_mode = 'add', 'add'
     else:
         season_mode, trend_mode = 'mul', 'add'
@@ -82,36 +88,41 @@ def add_holt_winters_forecast(ax, dates, values, future_days=28, color='red'):
         plot_dates = [series.index[-1]] + list(forecast.index)
         plot_values = [series.iloc[-1]] + list(forecast.values)
         ax.plot(plot_dates, plot_values, color=color, linestyle='-', linewidth=3, 
-                label=f'Seasonal Model (+{future_days} Days)')
+                label=f'Seasonal Model (+{future_days} Days){" - Selected" if selected else ""}')
         
         return forecast.mean() # Return avg prediction for AI
     except Exception as e:
         print(f"   -> HW Error: {e}")
         return None
 
-def generate_zoom_forecast(history_df):
+def zoom_series_forecast(series, model, label, days=7):
+    """Forecast with the (usable) selected model, then the default HW model; None if both fail."""
+    first = backtesting.usable_model(series, model) if model else backtesting.default_model(series)
+    for candidate in dict.fromkeys([first, backtesting.default_model(series)]):
+        try:
+            return backtesting.forecast(series, candidate, days)
+        except Exception as e:
+            print(f"   -> Zoom {label} Error ({candidate}): {e}")
+    return None
+
+def generate_zoom_forecast(history_df, models=None):
     """Generates the 7-Day Zoom Chart and returns forecast stats."""
     if history_df.empty: return None, {}
+    models = models or {}
 
     dates = pd.to_datetime(history_df['Submitted'])
     
     # 1. Forecast VOLUME
     vol_series = pd.Series(history_df['Vol'].values, index=dates).astype(float).asfreq('D').interpolate()
-    try:
-        mode = 'mul' if (vol_series > 0).all() else 'add'
-        vol_model = ExponentialSmoothing(vol_series, trend='add', seasonal=mode, seasonal_periods=7).fit()
-        vol_forecast = vol_model.forecast(7)
-    except:
-        vol_forecast = pd.Series([0]*7)
+    vol_forecast = zoom_series_forecast(vol_series, models.get('Vol'), 'Volume')
 
     # 2. Forecast ERRORS
     err_series = pd.Series(history_df['Errors'].values, index=dates).astype(float).asfreq('D').interpolate()
-    try:
-        mode_err = 'mul' if (err_series > 0).all() else 'add'
-        err_model = ExponentialSmoothing(err_series, trend='add', seasonal=mode_err, seasonal_periods=7).fit()
-        err_forecast = err_model.forecast(7)
-    except:
-        err_forecast = pd.Series([0]*7)
+    err_forecast = zoom_series_forecast(err_series, models.get('Errors'), 'Errors')
+
+    # A failed model must not reach the AI as a confident zero
+    if vol_forecast is None or err_forecast is None:
+        return None, {"Status": "Unavailable - 7-day forecast models failed this run"}
 
     # 3. Capture Stats for AI
     zoom_stats = {
@@ -157,7 +168,7 @@ def generate_zoom_forecast(history_df):
     
     return buf, zoom_stats
 
-def generate_executive_charts(history_df):
+def generate_executive_charts(history_df, backtest_results=None):
     """Generates charts and compiles forecast data for the AI."""
     if history_df.empty: return None, None, None, None, {}
 
@@ -170,6 +181,11 @@ def generate_executive_charts(history_df):
     plt.switch_backend('Agg') 
     buffers = []
     forecast_data = {} # Container for AI data
+    # Selected models, minus any that can't fit the current data - these are the models that run
+    models = {
+        metric: backtesting.usable_model(backtesting.daily_series(history_df, metric), model)
+        for metric, model in backtesting.selected_models(backtest_results).items() if metric in history_df
+    }
 
     # --- 1. SPEED ---
     fig1, ax1 = plt.subplots(figsize=(14, 8))
@@ -178,14 +194,25 @@ def generate_executive_charts(history_df):
     ax2.plot(history_df['Submitted'], history_df['Speed'], color='tab:blue', alpha=0.3, label='Actual Speed')
     history_df['Speed_Trend'] = history_df['Speed'].rolling(window=7).mean()
     ax2.plot(history_df['Submitted'], history_df['Speed_Trend'], color='navy', linewidth=2, label='7-Day Avg')
+    if 'Speed_P95' in history_df:
+        ax2.plot(history_df['Submitted'], history_df['Speed_P50'], color='teal', linestyle=':', linewidth=1.5, label='Daily P50')
+        ax2.plot(history_df['Submitted'], history_df['Speed_P95'], color='purple', linestyle=':', linewidth=1.5, label='Daily P95')
     
-    # Generate Stats
-    final_speed_trend = add_extended_regression(ax2, history_df['Submitted'], history_df['Speed'], future_days=28, color='green', label='Regression Trend')
-    avg_speed_hw = add_holt_winters_forecast(ax2, history_df['Submitted'], history_df['Speed'], future_days=28, color='#d62728')
+    # Generate Stats - the projection reported to the AI is the line drawn for the selected model
+    selected = models.get('Speed')
+    _, avg_speed_reg = add_extended_regression(ax2, history_df['Submitted'], history_df['Speed'], future_days=28, color='green', label='Regression Trend', selected=selected == 'linear')
+    if selected == 'linear':
+        avg_speed_proj = avg_speed_reg
+    else:
+        avg_speed_proj = add_holt_winters_forecast(ax2, history_df['Submitted'], history_df['Speed'], future_days=28, color='#d62728', selected_model=selected)
     
     speed_trend_dir, _ = get_trend_stats(history_df['Submitted'], history_df['Speed'])
     forecast_data['Speed_Trend_Direction'] = speed_trend_dir
-    forecast_data['Projected_Avg_Speed_Next_Month'] = round(avg_speed_hw, 1) if avg_speed_hw else "N/A"
+    forecast_data['Projected_Avg_Speed_Next_Month'] = round(avg_speed_proj, 1) if avg_speed_proj else "N/A"
+    if 'Speed_P95' in history_df:
+        p95 = history_df[['Submitted', 'Speed_P95']].dropna()
+        p95_trend_dir, _ = get_trend_stats(p95['Submitted'], p95['Speed_P95'])
+        forecast_data['Speed_P95_Trend_Direction'] = p95_trend_dir
 
     ax2.set_ylabel("Automation Time (Sec - Lower is Better)", color='navy', fontweight='bold')
     ax1.set_title("Predicted Speed Forecast: History + 28 Day Projection", fontweight='bold', fontsize=16, y=1.08)
@@ -203,12 +230,16 @@ def generate_executive_charts(history_df):
     # --- 2. VOLUME ---
     fig2, ax = plt.subplots(figsize=(14, 8))
     ax.plot(history_df['Submitted'], history_df['Vol'], color='tab:green', alpha=0.5, label='Actual Volume')
-    add_extended_regression(ax, history_df['Submitted'], history_df['Vol'], future_days=28, color='black', label='Linear Trend')
-    avg_vol_hw = add_holt_winters_forecast(ax, history_df['Submitted'], history_df['Vol'], future_days=28, color='orange')
+    selected = models.get('Vol')
+    _, avg_vol_reg = add_extended_regression(ax, history_df['Submitted'], history_df['Vol'], future_days=28, color='black', label='Linear Trend', selected=selected == 'linear')
+    if selected == 'linear':
+        avg_vol_proj = avg_vol_reg
+    else:
+        avg_vol_proj = add_holt_winters_forecast(ax, history_df['Submitted'], history_df['Vol'], future_days=28, color='orange', selected_model=selected)
     
     vol_trend_dir, _ = get_trend_stats(history_df['Submitted'], history_df['Vol'])
     forecast_data['Volume_Trend_Direction'] = vol_trend_dir
-    forecast_data['Projected_Avg_Daily_Vol_Next_Month'] = int(avg_vol_hw) if avg_vol_hw else "N/A"
+    forecast_data['Projected_Avg_Daily_Vol_Next_Month'] = int(avg_vol_proj) if avg_vol_proj else "N/A"
 
     ax.set_ylabel("Total Jobs Processed", fontweight='bold')
     ax.set_title("Predicted Volume Forecast: History + 28 Day Projection", fontweight='bold', fontsize=16, y=1.08)
@@ -224,12 +255,16 @@ def generate_executive_charts(history_df):
     # --- 3. RELIABILITY ---
     fig3, ax = plt.subplots(figsize=(14, 8))
     ax.plot(history_df['Submitted'], history_df['ErrorRate'], color='tab:red', alpha=0.5, label='Actual Failure %')
-    add_extended_regression(ax, history_df['Submitted'], history_df['ErrorRate'], future_days=28, color='blue', label='Linear Trend')
-    avg_err_hw = add_holt_winters_forecast(ax, history_df['Submitted'], history_df['ErrorRate'], future_days=28, color='black')
+    selected = models.get('ErrorRate')
+    _, avg_err_reg = add_extended_regression(ax, history_df['Submitted'], history_df['ErrorRate'], future_days=28, color='blue', label='Linear Trend', selected=selected == 'linear')
+    if selected == 'linear':
+        avg_err_proj = avg_err_reg
+    else:
+        avg_err_proj = add_holt_winters_forecast(ax, history_df['Submitted'], history_df['ErrorRate'], future_days=28, color='black', selected_model=selected)
 
     err_trend_dir, _ = get_trend_stats(history_df['Submitted'], history_df['ErrorRate'])
     forecast_data['Error_Trend_Direction'] = err_trend_dir
-    forecast_data['Projected_Avg_ErrorRate_Next_Month'] = f"{round(avg_err_hw, 2)}%" if avg_err_hw else "N/A"
+    forecast_data['Projected_Avg_ErrorRate_Next_Month'] = f"{round(avg_err_proj, 2)}%" if avg_err_proj else "N/A"
 
     ax.set_ylabel("Failure Rate (%)", fontweight='bold', color='darkred')
     ax.set_title("Predicted Reliability Forecast: History + 28 Day Projection", fontweight='bold', fontsize=16, y=1.08)
@@ -243,7 +278,133 @@ def generate_executive_charts(history_df):
     plt.close(fig3)
 
     # --- 4. ZOOM ---
-    buf_tactical, zoom_stats = generate_zoom_forecast(history_df)
+    buf_tactical, zoom_stats = generate_zoom_forecast(history_df, models)
     forecast_data['Next_7_Days_Tactical'] = zoom_stats
+    forecast_data['Model_Backtest_Accuracy'] = backtesting.summarise(backtest_results, models)
+
+    return buf1, buf2, buf3, buf_tactical, forecast_data
+
+def forecast_hourly_series(series, horizon=168, deadline=None, est_cost=0):
+    """
+    MSTL (24h + 168h seasonality) with a damped Holt trend; seasonal naive if out of time or data.
+    MSTL only starts when the time left before `deadline` covers `est_cost` with 50% headroom.
+    Returns (forecast, model label, measured fit seconds or None if MSTL was not run).
+    """
+    remaining = None if deadline is None else deadline - time.monotonic()
+    if len(series) >= 2 * 168 and (remaining is None or remaining >= est_cost * 1.5):
+        started = time.monotonic()
+        try:
+            decomposition = MSTL(series, periods=(24, 168)).fit()
+            seasonal = decomposition.seasonal.sum(axis=1)
+            deseasonalised = decomposition.trend + decomposition.resid
+
+            trend_model = ExponentialSmoothing(deseasonalised, trend='add', damped_trend=True).fit()
+            # 168 is a multiple of 24, so repeating the last week carries both cycles forward
+            future_season = np.resize(seasonal.iloc[-168:].values, horizon)
+            forecast = trend_model.forecast(horizon) + future_season
+            return forecast.clip(lower=0), "MSTL (24h + 168h) + Damped Holt", time.monotonic() - started
+        except Exception as e:
+            print(f"   -> MSTL Error: {e}")
+    elif remaining is not None:
+        print(f"   -> Skipping MSTL: {remaining:.0f}s left vs ~{est_cost:.0f}s estimated fit")
+
+    # Fallback: same hour last week
+    last_week = series.iloc[-168:]
+    future_index = pd.date_range(series.index[-1] + pd.Timedelta(hours=1), periods=horizon, freq='h')
+    return pd.Series(np.resize(last_week.values, horizon), index=future_index), "Seasonal Naive (Last Week)", None
+
+def generate_hourly_forecast(hourly_df, shift_map, deadline=None):
+    """
+    Generates the next-7-days hour x shift forecast grid, its heatmap chart and stats for the AI.
+    `deadline` (time.monotonic()) is the hard stop left in the Function budget; the fits
+    use whichever is sooner of it and HOURLY_FIT_BUDGET_SECONDS from now.
+    """
+    if hourly_df.empty: return None, {}
+
+    print("   -> Generating Hourly Shift Forecast (MSTL 24h/168h)...")
+    cutoff = pd.to_datetime(config.CURRENT_WEEK_END) + timedelta(days=1)
+    hourly_df = hourly_df.copy()
+    hourly_df['Submitted'] = pd.to_datetime(hourly_df['Submitted']).dt.tz_localize(None)
+    hourly_df = hourly_df[hourly_df['Submitted'] < cutoff]
+    if hourly_df.empty: return None, {}
+
+    # Hours with no jobs are genuine zeros, not gaps to interpolate
+    indexed = hourly_df.set_index('Submitted')
+    full_index = pd.date_range(indexed.index.min(), cutoff - timedelta(hours=1), freq='h')
+    vol_series = indexed['Vol'].astype(float).reindex(full_index, fill_value=0).asfreq('h')
+    err_series = indexed['Errors'].astype(float).reindex(full_index, fill_value=0).asfreq('h')
+    if len(vol_series) < 168: return None, {}
+
+    # 1. Fit within the Function time budget - the first fit's cost sizes up the second
+    started = time.monotonic()
+    fit_deadline = started + config.HOURLY_FIT_BUDGET_SECONDS
+    if deadline is not None: fit_deadline = min(fit_deadline, deadline)
+    est_cost = config.HOURLY_FIT_COST_PRIOR_SECONDS
+    vol_forecast, vol_model, vol_cost = forecast_hourly_series(vol_series, deadline=fit_deadline, est_cost=est_cost)
+    if vol_cost is not None: est_cost = vol_cost
+    err_forecast, err_model, _ = forecast_hourly_series(err_series, deadline=fit_deadline, est_cost=est_cost)
+    print(f"      ...Hourly fit completed in {time.monotonic() - started:.1f}s")
+
+    # 2. Hour x Shift grid
+    grid = pd.DataFrame({'Vol': vol_forecast.values, 'Errors': err_forecast.values}, index=vol_forecast.index)
+    grid['Date'] = grid.index.strftime('%a %d-%b')
+    grid['Hour'] = grid.index.hour
+    grid['Shift'] = grid['Hour'].map(lambda h: shift_map.get(h, 'Unknown'))
+
+    shift_totals = grid.groupby('Shift')[['Vol', 'Errors']].sum()
+    peak_vol = grid.nlargest(5, 'Vol')
+    peak_err = grid.nlargest(5, 'Errors')
+
+    hourly_stats = {
+        "Model": vol_model if vol_model == err_model else f"Volume: {vol_model}; Errors: {err_model}",
+        "Shift_Totals_Next_7_Days": {
+            shift: {
+                "Vol": int(row['Vol']),
+                "Errors": int(row['Errors']),
+                "Error_Rate": round((row['Errors'] / row['Vol']) * 100, 2) if row['Vol'] > 0 else 0
+            }
+            for shift, row in shift_totals.iterrows()
+        },
+        "Peak_Volume_Hours": {f"{d} {h:02d}:00 ({sh})": int(v) for d, h, sh, v in zip(peak_vol['Date'], peak_vol['Hour'], peak_vol['Shift'], peak_vol['Vol'])},
+        "Peak_Error_Hours": {f"{d} {h:02d}:00 ({sh})": int(v) for d, h, sh, v in zip(peak_err['Date'], peak_err['Hour'], peak_err['Shift'], peak_err['Errors'])}
+    }
+
+    # 3. Plotting
+    dates_order = list(dict.fromkeys(grid['Date']))
+    vol_grid = grid.pivot(index='Date', columns='Hour', values='Vol').reindex(dates_order)
+    err_grid = grid.pivot(index='Date', columns='Hour', values='Errors').reindex(dates_order)
+
+    plt.switch_backend('Agg')
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 8), sharex=True)
+    sns.heatmap(vol_grid, ax=ax1, cmap='Greens', cbar_kws={'label': 'Jobs'})
+    sns.heatmap(err_grid, ax=ax2, cmap='Reds', cbar_kws={'label': 'Errors'})
+    ax1.set_title("Predicted Volume by Hour", fontsize=12, fontweight='bold', pad=24)
+    ax2.set_title("Predicted Errors by Hour", fontsize=12, fontweight='bold')
+    ax1.set_ylabel("")
+    ax2.set_ylabel("")
+    ax1.set_xlabel("")
+    ax2.set_xlabel("Hour of Day (UTC)", fontweight='bold')
+
+    # Shift boundaries + labels
+    hours = list(range(24))
+    segments = []
+    for h in hours:
+        shift = shift_map.get(h, 'Unknown')
+        if not segments or segments[-1][0] != shift:
+            segments.append([shift, h, h + 1])
+        else:
+            segments[-1][2] = h + 1
+    for shift, start, end in segments:
+        for ax in (ax1, ax2):
+            if start > 0: ax.axvline(start, color='black', linewidth=2)
+        ax1.text((start + end) / 2, -0.3, shift, ha='center', va='bottom', fontsize=10, fontweight='bold')
+
+    fig.suptitle("Predictive Forecast: Next 7 Days (Hour x Shift)", fontweight='bold', fontsize=16)
+    plt.tight_layout(rect=[0, 0, 1, 0.95])
+
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=100)
+    buf.seek(0)
+    plt.close(fig)
 
-    return buf1, buf2, buf3, buf_tactical, forecast_data
\ No newline at end of file
+    return buf, hourly_stats
@@ -10,7 +10,12 @@ def clean_utf8(text):
     if not isinstance(text, str): return str(text)
     return text.encode('latin-1', 'replace').decode('latin-1')
 
-def build_pdf(text, data, img_speed, img_vol, img_err, img_tactical):
+def clean_cell(value):
+    """Missing values arrive as 'nan'/'None' strings after safe_json - show them as N/A."""
+    text = str(value) if value is not None else ''
+    return 'N/A' if text.strip().lower() in ('', 'nan', 'none', 'nat') else text
+
+def build_pdf(text, data, img_speed, img_vol, img_err, img_tactical, img_hourly=None):
     pdf = PDFReport()
     pdf.add_page()
     
@@ -34,11 +39,13 @@ def build_pdf(text, data, img_speed, img_vol, img_err, img_tactical):
     pdf.set_fill_color(240, 240, 240)
     
     # Headers
-    pdf.cell(50, 10, "Printer ID", 1, 0, 'C', 1)
-    pdf.cell(35, 10, "Cur Err%", 1, 0, 'C', 1)
-    pdf.cell(35, 10, "Hist Err%", 1, 0, 'C', 1)
-    pdf.cell(35, 10, "Cur Speed", 1, 0, 'C', 1)
-    pdf.cell(35, 10, "Hist Speed", 1, 1, 'C', 1)
+    pdf.cell(40, 10, "Printer ID", 1, 0, 'C', 1)
+    pdf.cell(25, 10, "Cur Err%", 1, 0, 'C', 1)
+    pdf.cell(25, 10, "Hist Err%", 1, 0, 'C', 1)
+    pdf.cell(25, 10, "Cur Speed", 1, 0, 'C', 1)
+    pdf.cell(25, 10, "Hist Speed", 1, 0, 'C', 1)
+    pdf.cell(25, 10, "Cur P95", 1, 0, 'C', 1)
+    pdf.cell(25, 10, "Hist P95", 1, 1, 'C', 1)
     
     pdf.set_font("Arial", "", 10)
     if 'Assets' in data and data['Assets']:
@@ -53,11 +60,13 @@ def build_pdf(text, data, img_speed, img_vol, img_err, img_tactical):
             
             p_name = clean_utf8(row.get('EnginePrinter', 'N/A'))
             
-            pdf.cell(50, 10, p_name, 1)
-            pdf.cell(35, 10, f"{err_curr}%", 1, 0, 'C')
-            pdf.cell(35, 10, f"{err_hist}%", 1, 0, 'C')
-            pdf.cell(35, 10, str(row.get('Speed',0)), 1, 0, 'C')
-            pdf.cell(35, 10, str(row.get('Hist_Speed',0)), 1, 1, 'C')
+            pdf.cell(40, 10, p_name, 1)
+            pdf.cell(25, 10, f"{err_curr}%", 1, 0, 'C')
+            pdf.cell(25, 10, f"{err_hist}%", 1, 0, 'C')
+            pdf.cell(25, 10, clean_cell(row.get('Speed')), 1, 0, 'C')
+            pdf.cell(25, 10, clean_cell(row.get('Hist_Speed')), 1, 0, 'C')
+            pdf.cell(25, 10, clean_cell(row.get('P95')), 1, 0, 'C')
+            pdf.cell(25, 10, clean_cell(row.get('Hist_P95')), 1, 1, 'C')
     else:
         pdf.cell(0, 10, "No Asset Data Available", 1, 1, 'C')
         
@@ -95,4 +104,12 @@ def build_pdf(text, data, img_speed, img_vol, img_err, img_tactical):
         with open("temp_err.png", "wb") as f: f.write(img_err.getbuffer())
         pdf.image("temp_err.png", x=10, y=25, w=270)
 
+    # --- 5. HOURLY SHIFT FORECAST ---
+    if img_hourly:
+        pdf.add_page(orientation='L')
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, "5. Hourly Forecast: Next 7 Days (Hour x Shift)", ln=True)
+        with open("temp_hourly.png", "wb") as f: f.write(img_hourly.getbuffer())
+        pdf.image("temp_hourly.png", x=10, y=25, w=270)
+
     return pdf.output(dest='S').encode('latin-1')
\ No newline at end of file
@@ -0,0 +1,63 @@
+import os
+import hashlib
+import pandas as pd
+import config
+import latency_sketch
+
+# Per-day latency sketch store.
+# A day's sketch can't change once the day (plus the ingestion grace) has closed, so each
+# closed day is written once as a small CSV of (Country, EnginePrinter, Bucket, Count) and
+# later runs only query ADX for the days that aren't stored yet. The store is partitioned by
+# source, country and sketch accuracy so changing any of them starts a fresh set of days.
+
+COLUMNS = ['Country', 'EnginePrinter', 'Bucket', 'Count']
+
+def _store_dir():
+    key = "|".join([str(config.ADX_CLUSTER), str(config.ADX_DB), str(config.FILTER_COUNTRY),
+                    repr(latency_sketch.RELATIVE_ACCURACY)])
+    return os.path.join(config.SKETCH_STORE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest()[:16])
+
+def _day_path(day):
+    return os.path.join(_store_dir(), f"{pd.Timestamp(day):%Y-%m-%d}.csv")
+
+def is_closed(day):
+    """True once the day has ended and late ingestion has had INGESTION_GRACE_HOURS to land."""
+    closed_at = pd.Timestamp(day, tz='UTC') + pd.Timedelta(days=1) + pd.Timedelta(hours=config.INGESTION_GRACE_HOURS)
+    return pd.Timestamp.now(tz='UTC') >= closed_at
+
+def load(days):
+    """Returns (stored sketch rows for the given days, days that are not in the store)."""
+    frames, missing = [], []
+    for day in days:
+        try:
+            df = pd.read_csv(_day_path(day), dtype={'Country': str, 'EnginePrinter': str})
+        except FileNotFoundError:
+            missing.append(day)
+            continue
+        except Exception as e:
+            print(f"   -> Unreadable stored sketch for {pd.Timestamp(day):%Y-%m-%d} ({e}), re-querying")
+            missing.append(day)
+            continue
+        df['Day'] = pd.Timestamp(day)
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns=['Day'] + COLUMNS), missing
+    return pd.concat(frames, ignore_index=True)[['Day'] + COLUMNS], missing
+
+def save(sketch_df, days):
+    """Stores the closed days among `days` (empty ones too, so they aren't re-queried). Returns count saved."""
+    saved = 0
+    try:
+        os.makedirs(_store_dir(), mode=0o700, exist_ok=True)
+        for day in days:
+            if not is_closed(day):
+                continue
+            path = _day_path(day)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            sketch_df.loc[sketch_df['Day'] == pd.Timestamp(day), COLUMNS].to_csv(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            saved += 1
+    except Exception as e:
+        print(f"   -> Sketch store write failed: {e}")
+    return saved